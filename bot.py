@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json
+import asyncio
+import hashlib
 import logging
 import os
-import requests
+import re
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, fields
 from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Dict, Optional
+from typing import AsyncIterator, Deque, Dict, FrozenSet, List, Optional
 
+import httpx
+import orjson
+from cachetools import TTLCache
 from telegram import Update, BotCommand
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     Application,
@@ -18,89 +26,373 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from tenacity import retry, stop_after_attempt, wait_exponential
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for the redis rate limit backend
+    aioredis = None
+
+try:
+    import uvloop
+except ImportError:  # optional faster event loop, not available on Windows
+    uvloop = None
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant for telegram."
+
+# Telegram rejects messages longer than this
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+@dataclass(frozen=True, slots=True)
+class TelegramConfig:
+    """telegram section of config.json"""
+    token: str
+    allowed_users: FrozenSet[str] = frozenset()
+    # None when the key is left out, which places no restriction on groups
+    allowed_groups: Optional[FrozenSet[int]] = None
+    max_response_length: int = TELEGRAM_MESSAGE_LIMIT
+    max_response_chunks: int = 5
+    stream_edit_interval: float = 1.0
+    webhook_url: Optional[str] = None
+    webhook_listen: str = '0.0.0.0'
+    webhook_port: int = 8443
+    webhook_path: str = 'telegram'
+    webhook_secret: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class ClaudeConfig:
+    """claude section of config.json"""
+    api_key: str
+    api_url: str
+    api_version: str
+    model: str
+    max_tokens: int
+    temperature: float = 0.7
+    timeout: float = 30
+    cache_size: int = 1024
+    cache_ttl: float = 3600
+    max_connections: int = 100
+    http2: bool = False
+    max_concurrent: int = 50
+    max_queued: int = 100
+    stream: bool = False
+
+@dataclass(frozen=True, slots=True)
+class RateLimitConfig:
+    """rate_limit section of config.json"""
+    max_messages_per_hour: int
+    cooldown_seconds: float
+    backend: str = 'memory'
+    redis_url: str = 'redis://localhost:6379/0'
+
+@dataclass(frozen=True, slots=True)
+class LoggingConfig:
+    """logging section of config.json"""
+    level: str
+    format: str
+    file: str
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Bot configuration, parsed once so hot paths use attribute access"""
+    telegram: TelegramConfig
+    claude: ClaudeConfig
+    rate_limit: RateLimitConfig
+    logging: LoggingConfig
+
+    @staticmethod
+    def _section(section_cls, values: Optional[Dict], name: str):
+        """Build one config section, ignoring keys it doesn't define"""
+        if not isinstance(values, dict):
+            raise ValueError(f"Missing config section: {name}")
+        known = {f.name for f in fields(section_cls)}
+        try:
+            return section_cls(**{k: v for k, v in values.items() if k in known})
+        except TypeError as e:
+            raise ValueError(f"Invalid config section {name}: {str(e)}")
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> 'Config':
+        """Build the configuration from parsed config.json contents"""
+        telegram = raw.get('telegram')
+        if isinstance(telegram, dict):
+            # Allowlists are checked on every update, so store them as sets;
+            # group IDs become ints to compare directly with chat.id
+            telegram = dict(telegram, allowed_users=frozenset(telegram.get('allowed_users') or []))
+            if 'allowed_groups' in telegram:
+                try:
+                    telegram['allowed_groups'] = frozenset(int(g) for g in telegram['allowed_groups'] or [])
+                except ValueError:
+                    raise ValueError("Invalid group ID in telegram.allowed_groups")
+
+        return cls(
+            telegram=cls._section(TelegramConfig, telegram, 'telegram'),
+            claude=cls._section(ClaudeConfig, raw.get('claude'), 'claude'),
+            rate_limit=cls._section(RateLimitConfig, raw.get('rate_limit'), 'rate_limit'),
+            logging=cls._section(LoggingConfig, raw.get('logging'), 'logging'),
+        )
 
 # Load configuration
-def load_config() -> dict:
+def load_config() -> Config:
     """Load configuration file"""
     try:
-        with open('config.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open('config.json', 'rb') as f:
+            raw = orjson.loads(f.read())
     except FileNotFoundError:
         raise FileNotFoundError("Config file config.json not found")
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         raise ValueError("Invalid config file format")
 
+    return Config.from_dict(raw)
+
 CONFIG = load_config()
 
-# Setup logging
-logging.basicConfig(
-    level=getattr(logging, CONFIG['logging']['level']),
-    format=CONFIG['logging']['format'],
-    handlers=[
-        logging.FileHandler(CONFIG['logging']['file']),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+def setup_logging(config: Config):
+    """Send log records to the configured file and the console"""
+    logging.basicConfig(
+        level=getattr(logging, config.logging.level),
+        format=config.logging.format,
+        handlers=[
+            logging.FileHandler(config.logging.file),
+            logging.StreamHandler()
+        ]
+    )
 
-# User message rate limiting with config-based settings
-message_cooldowns: Dict[int, datetime] = {}
+logger = logging.getLogger(__name__)
 
 class UserRateLimit:
-    """User message rate limiting class"""
-    def __init__(self, config: Dict):
-        self.last_message_time: Dict[int, datetime] = {}
-        self.message_count: Dict[int, int] = defaultdict(int)
-        self.reset_time: Dict[int, datetime] = {}
-        self.max_messages = config['rate_limit']['max_messages_per_hour']
-        self.cooldown_time = timedelta(seconds=config['rate_limit']['cooldown_seconds'])
-    
+    """User message rate limiting class
+
+    Messages are counted in one-minute buckets and the hourly limit applies to
+    the sum over the last hour, so the allowance slides with time instead of
+    resetting on the hour. Timestamps come from the monotonic clock so wall
+    clock adjustments don't affect limits.
+    """
+    BUCKET_SECONDS = 60
+    WINDOW_BUCKETS = 60
+
+    def __init__(self, config: Config):
+        self.last_message_time: Dict[int, float] = {}
+        # user_id -> [minute bucket, message count] pairs, oldest first
+        self.buckets: Dict[int, Deque[List[int]]] = {}
+        self.max_messages = config.rate_limit.max_messages_per_hour
+        self.cooldown_time = config.rate_limit.cooldown_seconds
+
+    def reset(self):
+        """Forget all recorded messages"""
+        self.last_message_time.clear()
+        self.buckets.clear()
+
+    def _message_count(self, user_id: int, now: float) -> int:
+        """Drop buckets that left the window and count the remaining messages"""
+        buckets = self.buckets.get(user_id)
+        if not buckets:
+            return 0
+        oldest = int(now // self.BUCKET_SECONDS) - self.WINDOW_BUCKETS + 1
+        while buckets and buckets[0][0] < oldest:
+            buckets.popleft()
+        return sum(count for _, count in buckets)
+
+    def _record(self, user_id: int, now: float):
+        self.last_message_time[user_id] = now
+        bucket = int(now // self.BUCKET_SECONDS)
+        buckets = self.buckets.setdefault(user_id, deque(maxlen=self.WINDOW_BUCKETS))
+        if buckets and buckets[-1][0] == bucket:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([bucket, 1])
+
+    def _allowed(self, user_id: int, now: float) -> bool:
+        last = self.last_message_time.get(user_id)
+        if last is not None and now - last < self.cooldown_time:
+            return False
+        return self._message_count(user_id, now) < self.max_messages
+
     def can_send_message(self, user_id: int) -> bool:
-        now = datetime.now()
-        
-        # Reset counter
-        if user_id in self.reset_time and now > self.reset_time[user_id]:
-            self.message_count[user_id] = 0
-            
-        # Check frequency
-        if user_id in self.last_message_time:
-            time_diff = now - self.last_message_time[user_id]
-            if time_diff < self.cooldown_time:
-                return False
-            
-        return self.message_count[user_id] < self.max_messages
+        return self._allowed(user_id, time.monotonic())
 
     def update_user(self, user_id: int):
-        now = datetime.now()
-        self.last_message_time[user_id] = now
-        self.message_count[user_id] += 1
-        
-        # Set reset time to next hour
-        next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
-        self.reset_time[user_id] = next_hour
+        self._record(user_id, time.monotonic())
+
+    def try_acquire(self, user_id: int) -> bool:
+        """Check the limit and record the message in one step"""
+        now = time.monotonic()
+        if not self._allowed(user_id, now):
+            return False
+        self._record(user_id, now)
+        return True
+
+    async def acquire(self, user_id: int) -> bool:
+        """Async counterpart of try_acquire, shared with RedisRateLimit"""
+        return self.try_acquire(user_id)
+
+    async def close(self):
+        pass
+
+class RedisRateLimit:
+    """User message rate limiting shared by all bot instances through Redis
+
+    Each user's messages live in a sorted set scored by timestamp. A single Lua
+    script trims entries older than an hour, checks the cooldown and the hourly
+    limit, and records the message, so concurrent instances can't race.
+    """
+    WINDOW_SECONDS = 3600
+
+    SCRIPT = """
+    local key = KEYS[1]
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local last = redis.call('ZREVRANGE', key, 0, 0, 'WITHSCORES')
+    if last[2] and now - tonumber(last[2]) < tonumber(ARGV[4]) then
+        return 0
+    end
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('ZADD', key, now, ARGV[5])
+    redis.call('EXPIRE', key, window)
+    return 1
+    """
+
+    def __init__(self, config: Config):
+        if aioredis is None:
+            raise ImportError("The redis rate limit backend requires the redis package")
+        self.max_messages = config.rate_limit.max_messages_per_hour
+        self.cooldown_time = config.rate_limit.cooldown_seconds
+        self.redis = aioredis.from_url(config.rate_limit.redis_url)
+        self._script = self.redis.register_script(self.SCRIPT)
+
+    async def acquire(self, user_id: int) -> bool:
+        """Check the limit and record the message in one step"""
+        # Wall clock time, since timestamps are compared across processes
+        allowed = await self._script(
+            keys=[f"rl:{user_id}"],
+            args=[time.time(), self.WINDOW_SECONDS, self.max_messages,
+                  self.cooldown_time, uuid.uuid4().hex]
+        )
+        return bool(allowed)
+
+    async def close(self):
+        await self.redis.aclose()
+
+def create_rate_limiter(config: Config):
+    """Create the rate limiter selected by rate_limit.backend"""
+    backend = config.rate_limit.backend
+    if backend == 'redis':
+        return RedisRateLimit(config)
+    if backend != 'memory':
+        raise ValueError(f"Unknown rate limit backend: {backend}")
+    return UserRateLimit(config)
+
+class AIProviderBusyError(Exception):
+    """Raised when too many Claude API requests are already pending"""
 
 class AIProvider:
     """Class to handle Claude AI interactions"""
-    
-    def __init__(self, config: Dict):
+
+    MAX_ATTEMPTS = 3
+    # Longest Retry-After worth waiting for; past this the user gets an error
+    # instead of holding a request slot for minutes
+    MAX_RETRY_DELAY = 20
+
+    def __init__(self, config: Config):
         """Initialize AI provider with configuration"""
         self.config = config
-        self.api_url = config['claude']['api_url']
+        self.api_url = config.claude.api_url
         self.headers = {
-            "x-api-key": config['claude']['api_key'],
-            "anthropic-version": config['claude']['api_version'],
+            "x-api-key": config.claude.api_key,
+            "anthropic-version": config.claude.api_version,
             "content-type": "application/json"
         }
-        self.model = config['claude']['model']
-        self.max_tokens = config['claude']['max_tokens']
-        self.temperature = config['claude']['temperature']
-    
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+        self.model = config.claude.model
+        self.max_tokens = config.claude.max_tokens
+        self.temperature = config.claude.temperature
+        self.timeout = config.claude.timeout
+        self.max_connections = config.claude.max_connections
+        # HTTP/2 multiplexes concurrent requests over one connection; needs httpx[http2]
+        self.http2 = config.claude.http2
+        self._client: Optional[httpx.AsyncClient] = None
+        # In-flight requests keyed like the cache, shared by identical questions
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        # Cap simultaneous API calls and how many more may wait for a slot
+        self.max_concurrent = config.claude.max_concurrent
+        self.max_queued = config.claude.max_queued
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._pending = 0
+        # Exact-match cache of answers keyed by (system prompt, question)
+        self._cache: TTLCache = TTLCache(
+            maxsize=config.claude.cache_size,
+            ttl=config.claude.cache_ttl,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created lazily inside the running event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, keepalive_expiry=75),
+                http2=self.http2,
+            )
+        return self._client
+
+    async def close(self):
+        """Close the shared HTTP client and release pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _cache_key(message: str, system_prompt: Optional[str]) -> bytes:
+        """Build a response cache key, ignoring case and surrounding whitespace"""
+        raw = f"{system_prompt or ''}\x00{message.strip().lower()}"
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).digest()
+
+    def _reserve(self):
+        """Count a new API request, rejecting it if too many are already waiting"""
+        if self._pending >= self.max_concurrent + self.max_queued:
+            raise AIProviderBusyError("Too many pending Claude API requests")
+        self._pending += 1
+
+    def _finish(self, cache_key: bytes):
+        self._inflight.pop(cache_key, None)
+        self._pending -= 1
+
+    def _build_request(self, message: str, system_prompt: Optional[str]) -> Dict:
+        """Build the Messages API request body"""
+        data = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            #"temperature": self.temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": message
+                }
+            ]
+        }
+
+        if system_prompt:
+            # Mark the system prompt as a cacheable prefix; Anthropic only
+            # caches prompts above the model's minimum length (1024 tokens
+            # for Sonnet) and silently ignores the marker otherwise
+            data["system"] = [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ]
+
+        return data
+
     async def get_response(self, message: str, system_prompt: Optional[str] = None) -> str:
         """
         Get response from Claude API
         
+        Concurrent calls with the same question share a single API request.
+
         Args:
             message: User message
             system_prompt (Optional[str]): Optional system prompt to set context
@@ -108,109 +400,305 @@ class AIProvider:
         Returns:
             AI response text
         """
-        try:
-            data = {
-                "model": self.model,
-                "max_tokens": self.max_tokens,
-                #"temperature": self.temperature,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": message
-                    }
-                ]
-            }
-
-            if system_prompt:
-                data["system"] = system_prompt
-
-            # Log request details with proper JSON formatting
-            logger.debug("=== API Request ===")
-            logger.debug(f"URL: {self.api_url}")
-            logger.debug("Headers:")
-            logger.debug(json.dumps(self.headers, indent=2, ensure_ascii=False))
-            logger.debug("Request Body:")
-            logger.debug(json.dumps(data, indent=2, ensure_ascii=False))
-           
+        cache_key = self._cache_key(message, system_prompt)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit")
+            return cached
+
+        request = self._inflight.get(cache_key)
+        if request is None:
+            self._reserve()
+            request = asyncio.ensure_future(self._request(message, system_prompt, cache_key))
+            self._inflight[cache_key] = request
+            request.add_done_callback(lambda _: self._finish(cache_key))
+        else:
+            logger.debug("Joining in-flight request")
+
+        # Shield the shared request so one caller's cancellation doesn't affect the others
+        return await asyncio.shield(request)
+
+    @classmethod
+    def _retry_delay(cls, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None if it isn't retryable"""
+        backoff = min(4 * 2 ** (attempt - 1), 10)
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            # Other 4xx errors will fail the same way again
+            if status < 500 and status != 429:
+                return None
+            retry_after = error.response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    delay = max(float(retry_after), 0.0)
+                except ValueError:
+                    pass
+                else:
+                    return delay if delay <= cls.MAX_RETRY_DELAY else None
+            return backoff
+        if isinstance(error, httpx.TransportError):
+            return backoff
+        return None
+
+    async def _request(self, message: str, system_prompt: Optional[str], cache_key: bytes) -> str:
+        """Send a single request to the Claude API and cache the answer"""
+        data = self._build_request(message, system_prompt)
+
+        # Log request details with proper JSON formatting, skipping the
+        # serialization entirely unless debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "API Request url=%s headers=%s body=%s",
+                self.api_url,
+                orjson.dumps(self.headers, option=orjson.OPT_INDENT_2).decode(),
+                orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+            )
+
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
             try:
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=data
-                )
-            
+                async with self._semaphore:
+                    response = await self.client.post(self.api_url, content=orjson.dumps(data))
                 response.raise_for_status()  # Raise an error for bad status codes
-            
-                response_data = response.json()
-                logger.debug(f"API Response: {response_data}")
-            
-                if 'content' in response_data and len(response_data['content']) > 0:
-                    return response_data['content'][0]['text']
-                else:
+
+                response_data = orjson.loads(response.content)
+                logger.debug("API Response: %s", response_data)
+
+                usage = response_data.get('usage', {})
+                logger.debug(
+                    "Prompt cache - read: %s, created: %s",
+                    usage.get('cache_read_input_tokens', 0),
+                    usage.get('cache_creation_input_tokens', 0)
+                )
+
+                if not response_data.get('content'):
                     raise Exception("No content in response")
-            except requests.exceptions.RequestException as e:
-                print(f"Error calling Claude API: {str(e)}")
-                raise
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error getting response from Claude API: {str(e)}")
-            logger.error(f"Response status code: {e.response.status_code if e.response else 'No response'}")
-            logger.error(f"Response text: {e.response.text if e.response else 'No response'}")
-            raise
-        except Exception as e:
-            logger.error(f"Error processing Claude API response: {str(e)}")
-            raise
+                text = response_data['content'][0]['text']
+                break
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.MAX_ATTEMPTS:
+                    logger.exception(f"Error getting response from Claude API: {str(e)}")
+                    raise
+                logger.warning(f"Error getting response from Claude API: {str(e)} - retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        if self._cache.maxsize:
+            self._cache[cache_key] = text
+        return text
+
+    async def stream_response(self, message: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream a response from Claude API
+
+        Args:
+            message: User message
+            system_prompt (Optional[str]): Optional system prompt to set context
+
+        Yields:
+            Chunks of AI response text as they are generated
+        """
+        cache_key = self._cache_key(message, system_prompt)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit")
+            yield cached
+            return
+
+        data = self._build_request(message, system_prompt)
+        data["stream"] = True
+        parts = []
+        stopped = False
+
+        self._reserve()
+        try:
+            for attempt in range(1, self.MAX_ATTEMPTS + 1):
+                try:
+                    async with self._semaphore:
+                        async with self.client.stream("POST", self.api_url, content=orjson.dumps(data)) as response:
+                            response.raise_for_status()
+
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                event = orjson.loads(line[5:])
+                                if event["type"] == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                                    parts.append(event["delta"]["text"])
+                                    yield event["delta"]["text"]
+                                elif event["type"] == "error":
+                                    raise Exception(f"Stream error: {event['error'].get('message')}")
+                                elif event["type"] == "message_stop":
+                                    stopped = True
+                                    break
+                    # A stream cut off early would otherwise be taken, and
+                    # cached, as the complete answer
+                    if not stopped:
+                        raise Exception("Stream ended before message_stop")
+                    if not ''.join(parts).strip():
+                        raise Exception("No content in response")
+                    break
+                except Exception as e:
+                    # Text already sent to the user can't be taken back, so only
+                    # retry failures that happen before the first delta
+                    delay = None if parts else self._retry_delay(e, attempt)
+                    if delay is None or attempt == self.MAX_ATTEMPTS:
+                        logger.exception(f"Error getting response from Claude API: {str(e)}")
+                        raise
+                    logger.warning(f"Error getting response from Claude API: {str(e)} - retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self._pending -= 1
+
+        if self._cache.maxsize:
+            self._cache[cache_key] = ''.join(parts)
+
+# Reply texts
+WELCOME_TEXT = (
+    "👋 Hello! I'm an AI assistant powered by Claude.\n\n"
+    "📝 How to use:\n"
+    "1. In private chat, just send me your questions directly\n"
+    "2. In groups, mention me (@bot) with your question\n"
+    "3. Use /help to see all available commands\n"
+    "4. Use /status to check system status\n\n"
+    "⚠️ Note: Message rate limiting is enabled to prevent abuse"
+)
+HELP_TEXT = (
+    "🤖 Bot Commands:\n\n"
+    "/start - Start the bot and see welcome message\n"
+    "/help - Display this help message\n"
+    "/status - Check system status\n"
+    "/reset - Reset your conversation\n"
+    "\n"
+    "💡 Tips:\n"
+    "- In private chat, just send your questions directly\n"
+    "- In groups, mention me with @bot_username"
+)
+# Everything but the server time, which is appended per request
+STATUS_PREFIX = (
+    "🔄 System Status:\n\n"
+    "✅ Bot is running normally\n"
+    f"📊 Current model: {CONFIG.claude.model}\n"
+    "⏰ Server time: "
+)
+STATUS_ERROR_TEXT = "❌ Error while retrieving status"
+RESET_TEXT = "✨ Your conversation history has been reset"
+UNAUTHORIZED_TEXT = "⚠️ Sorry, you don't have permission to use this bot"
+UNAUTHORIZED_GROUP_TEXT = "⚠️ This bot can only be used in authorized groups. Leaving the chat..."
+EMPTY_QUESTION_TEXT = "❓ Please ask a question"
+RATE_LIMIT_TEXT = "⚠️ You're sending messages too frequently. Please wait a moment."
+STREAM_PLACEHOLDER_TEXT = "…"
+BUSY_TEXT = "⏳ The bot is busy right now. Please try again in a moment."
+ERROR_TEXT = "❌ Sorry, an error occurred while processing your request. Please try again later."
+INTERNAL_ERROR_TEXT = "❌ An internal error occurred. Please try again later."
+
+TRUNCATED_SUFFIX = "...(response truncated)"
+
+def split_response(text: str, chunk_size: int, max_chunks: int) -> List[str]:
+    """
+    Split a response into message-sized chunks
+
+    Args:
+        text: Response text
+        chunk_size: Maximum length of each chunk
+        max_chunks: Maximum number of chunks; anything beyond is truncated
+
+    Returns:
+        List of chunks to send in order
+    """
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or [text]
+    if len(chunks) > max_chunks:
+        chunks = chunks[:max_chunks]
+        chunks[-1] = chunks[-1][:chunk_size - len(TRUNCATED_SUFFIX)] + TRUNCATED_SUFFIX
+    return chunks
 
 # Initialize providers with config
-rate_limiter = UserRateLimit(CONFIG)
+rate_limiter = create_rate_limiter(CONFIG)
 ai_provider = AIProvider(CONFIG)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
-    welcome_message = (
-        "👋 Hello! I'm an AI assistant powered by Claude.\n\n"
-        "📝 How to use:\n"
-        "1. In private chat, just send me your questions directly\n"
-        "2. In groups, mention me (@bot) with your question\n"
-        "3. Use /help to see all available commands\n"
-        "4. Use /status to check system status\n\n"
-        "⚠️ Note: Message rate limiting is enabled to prevent abuse"
-    )
-    await update.message.reply_text(welcome_message)
+    await update.message.reply_text(WELCOME_TEXT)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command"""
-    help_text = (
-        "🤖 Bot Commands:\n\n"
-        "/start - Start the bot and see welcome message\n"
-        "/help - Display this help message\n"
-        "/status - Check system status\n"
-        "/reset - Reset your conversation\n"
-        "\n"
-        "💡 Tips:\n"
-        "- In private chat, just send your questions directly\n"
-        "- In groups, mention me with @bot_username"
-    )
-    await update.message.reply_text(help_text)
+    await update.message.reply_text(HELP_TEXT)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command"""
     try:
-        status_text = (
-            "🔄 System Status:\n\n"
-            f"✅ Bot is running normally\n"
-            f"📊 Current model: {CONFIG['claude']['model']}\n"
-            f"⏰ Server time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        )
+        status_text = f"{STATUS_PREFIX}{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
         await update.message.reply_text(status_text)
     except Exception as e:
         logger.error(f"Error while getting status: {str(e)}")
-        await update.message.reply_text("❌ Error while retrieving status")
+        await update.message.reply_text(STATUS_ERROR_TEXT)
 
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /reset command"""
-    user_id = update.effective_user.id
-    await update.message.reply_text("✨ Your conversation history has been reset")
+    await update.message.reply_text(RESET_TEXT)
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Seconds flood control asks us to wait, whichever type PTB reports"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+async def stream_reply(update: Update, question: str, system_prompt: str) -> str:
+    """Stream the AI response into a reply, editing it as text arrives"""
+    chunk_size = min(CONFIG.telegram.max_response_length, TELEGRAM_MESSAGE_LIMIT)
+    # Telegram throttles frequent edits, so only edit once per interval
+    edit_interval = CONFIG.telegram.stream_edit_interval
+
+    reply = await update.message.reply_text(STREAM_PLACEHOLDER_TEXT, reply_to_message_id=update.message.message_id)
+    parts = []
+    shown = ""
+    last_edit = time.monotonic()
+
+    try:
+        async for delta in ai_provider.stream_response(question, system_prompt):
+            parts.append(delta)
+            now = time.monotonic()
+            if now - last_edit >= edit_interval:
+                text = ''.join(parts)[:chunk_size]
+                # Telegram trims message text, so whitespace-only growth would be
+                # rejected as "message is not modified"
+                if text.strip() and text.strip() != shown.strip():
+                    try:
+                        await reply.edit_text(text)
+                        shown = text
+                    except RetryAfter as e:
+                        # Flood control; hold further edits until it lifts
+                        now += retry_after_seconds(e)
+                        logger.warning(f"Streamed reply edits throttled: {str(e)}")
+                    except BadRequest as e:
+                        # An intermediate edit is only a preview; the final edit
+                        # below still delivers the full text
+                        logger.warning(f"Failed to update streamed reply: {str(e)}")
+                last_edit = now
+    except Exception:
+        # Nothing was streamed yet, so don't leave the placeholder behind
+        # next to the busy or error reply handle_message sends
+        if not shown:
+            try:
+                await reply.delete()
+            except TelegramError as e:
+                logger.warning(f"Failed to delete streamed reply placeholder: {str(e)}")
+        raise
+
+    response_text = ''.join(parts)
+    chunks = split_response(response_text, chunk_size, CONFIG.telegram.max_response_chunks)
+    if chunks[0].strip() and chunks[0].strip() != shown.strip():
+        try:
+            await reply.edit_text(chunks[0])
+        except RetryAfter as e:
+            # The final text must get through, so wait out flood control once
+            await asyncio.sleep(retry_after_seconds(e))
+            await reply.edit_text(chunks[0])
+
+    # Text beyond the first message goes out as follow-up replies
+    for chunk in chunks[1:]:
+        await update.message.reply_text(chunk, reply_to_message_id=update.message.message_id)
+
+    return response_text
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle messages mentioning the bot or direct messages in private chat"""
@@ -221,67 +709,76 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username
     
     # Check user permissions
-    if CONFIG['telegram']['allowed_users'] and username not in CONFIG['telegram']['allowed_users']:
+    allowed_users = CONFIG.telegram.allowed_users
+    if allowed_users and username not in allowed_users:
         logger.warning(f"Unauthorized access attempt: {username} ({user_id}), please add {username} to config.json - telegram.allowed_users")
-        await update.message.reply_text("⚠️ Sorry, you don't have permission to use this bot")
+        await update.message.reply_text(UNAUTHORIZED_TEXT)
         return
 
-    # Get bot info
-    bot = await context.bot.get_me()
-    
     # Process the message based on chat type
     if update.effective_chat.type == 'private':
         # In private chat, respond to all messages
         question = update.message.text.strip()
     else:
         # In groups, only respond when mentioned
-        if f'@{bot.username}' not in update.message.text:
+        text = update.message.text
+        if context.bot_data['bot_mention'] not in text:
             return
-        question = update.message.text.replace(f'@{bot.username}', '').strip()
+        question = context.bot_data['mention_re'].sub('', text).strip()
 
     # Check if message is empty
     if not question:
-        await update.message.reply_text("❓ Please ask a question")
+        await update.message.reply_text(EMPTY_QUESTION_TEXT)
         return
 
-    # Check message rate limit
-    if not rate_limiter.can_send_message(user_id):
+    # Check message rate limit and record the message
+    if not await rate_limiter.acquire(user_id):
         await update.message.reply_text(
-            "⚠️ You're sending messages too frequently. Please wait a moment.",
+            RATE_LIMIT_TEXT,
             reply_to_message_id=update.message.message_id
         )
         return
 
-    # Update user message rate statistics
-    rate_limiter.update_user(user_id)
-
     try:
         # Log user request
         logger.info(f"Received request - User: {user_id} ({username}) - Message: {question[:100]}...")
 
         #system prompt
-        system_prompt = "You are a helpful AI assistant for telegram."
-
-        # Get AI response
-        response_text = await ai_provider.get_response(question, system_prompt)
+        system_prompt = DEFAULT_SYSTEM_PROMPT
+
+        if CONFIG.claude.stream:
+            response_text = await stream_reply(update, question, system_prompt)
+        else:
+            # Get AI response
+            response_text = await ai_provider.get_response(question, system_prompt)
+
+            # Split long responses over several messages, in order
+            chunks = split_response(
+                response_text,
+                min(CONFIG.telegram.max_response_length, TELEGRAM_MESSAGE_LIMIT),
+                CONFIG.telegram.max_response_chunks
+            )
+            for chunk in chunks:
+                await update.message.reply_text(
+                    chunk,
+                    reply_to_message_id=update.message.message_id
+                )
         
-        # Check response length
-        if len(response_text) > CONFIG['telegram']['max_response_length']:
-            response_text = response_text[:CONFIG['telegram']['max_response_length']] + "...(response truncated)"
+        # Log response
+        logger.info(f"Sent response - User: {user_id} - Length: {len(response_text)}")
 
+    except AIProviderBusyError:
+        logger.warning(f"Rejected request from user {user_id}: too many pending Claude API requests")
         await update.message.reply_text(
-            response_text,
+            BUSY_TEXT,
             reply_to_message_id=update.message.message_id
         )
-        
-        # Log response
-        logger.info(f"Sent response - User: {user_id} - Length: {len(response_text)}")
 
     except Exception as e:
         error_message = f"Error processing request: {str(e)}"
         logger.error(error_message)
         await update.message.reply_text(
-            f"❌ Sorry, an error occurred while processing your request. Please try again later.",
+            ERROR_TEXT,
             reply_to_message_id=update.message.message_id
         )
 
@@ -289,109 +786,111 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
     logger.error(f"Update {update} caused error {context.error}")
     if update and update.effective_message:
-        await update.effective_message.reply_text(
-            "❌ An internal error occurred. Please try again later."
-        )
+        await update.effective_message.reply_text(INTERNAL_ERROR_TEXT)
+
+async def post_init(application: Application):
+    """Register bot commands and cache the bot identity"""
+    await application.bot.set_my_commands([
+        BotCommand("start", "Start the bot"),
+        BotCommand("help", "Show help message"),
+        BotCommand("status", "Check bot status"),
+        BotCommand("reset", "Reset conversation"),
+    ])
+
+    # The bot identity never changes, so fetch it once instead of per message
+    bot = await application.bot.get_me()
+    application.bot_data['bot_id'] = bot.id
+    application.bot_data['bot_username'] = bot.username
+    application.bot_data['bot_mention'] = f'@{bot.username}'
+    application.bot_data['mention_re'] = re.compile(re.escape(f'@{bot.username}'))
+
+async def post_shutdown(application: Application):
+    """Release resources held by the AI provider and rate limiter"""
+    await ai_provider.close()
+    await rate_limiter.close()
 
 async def handle_new_chat_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle when bot is added to a new group"""
-    bot = await context.bot.get_me()
+    bot_id = context.bot_data['bot_id']
     chat = update.effective_chat
 
     # Check if the bot was added to the group
     new_members = update.message.new_chat_members
-    if any(member.id == bot.id for member in new_members):
+    if any(member.id == bot_id for member in new_members):
         # Check if group is in whitelist
-        if 'allowed_groups' in CONFIG['telegram'] and str(chat.id) not in CONFIG['telegram']['allowed_groups']:
+        # Listing allowed_groups at all enforces it, even when empty
+        allowed_groups = CONFIG.telegram.allowed_groups
+        if allowed_groups is not None and chat.id not in allowed_groups:
             logger.warning(f"Bot added to unauthorized group: {chat.id} ({chat.title})")
-            await update.message.reply_text(
-                "⚠️ This bot can only be used in authorized groups. Leaving the chat..."
-            )
+            await update.message.reply_text(UNAUTHORIZED_GROUP_TEXT)
             # Leave the unauthorized group
             await chat.leave()
             return
 
+# Update filters, combined once at import rather than per application
+MESSAGE_FILTER = filters.TEXT & ~filters.COMMAND & (filters.ChatType.GROUPS | filters.ChatType.PRIVATE)
+NEW_CHAT_MEMBERS_FILTER = filters.StatusUpdate.NEW_CHAT_MEMBERS
+
+# Only messages are handled (new chat members arrive as message updates too),
+# so don't have Telegram deliver any other update types
+ALLOWED_UPDATES = [Update.MESSAGE]
+
 def main():
     """Main function"""
+    # Configured here rather than at import so importing the module (as the
+    # tests do) doesn't open the log file
+    setup_logging(CONFIG)
+
     try:
+        # Use the libuv-based event loop when available; run_polling and
+        # run_webhook pick up the current event loop
+        if uvloop is not None:
+            asyncio.set_event_loop(uvloop.new_event_loop())
+
         # Create application with group message permissions
         application = (
             Application.builder()
-            .token(CONFIG['telegram']['token'])
+            .token(CONFIG.telegram.token)
             .arbitrary_callback_data(True)
-            .post_init(lambda app: app.bot.set_my_commands([
-                BotCommand("start", "Start the bot"),
-                BotCommand("help", "Show help message"),
-                BotCommand("status", "Check bot status"),
-                BotCommand("reset", "Reset conversation"),
-            ]))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
             .build()
         )
 
-        # Add handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("status", status_command))
-        application.add_handler(CommandHandler("reset", reset_command))
-
-        # Add handler for new chat members (bot being added to groups)
-        application.add_handler(MessageHandler(
-            filters.StatusUpdate.NEW_CHAT_MEMBERS,
-            handle_new_chat_members
-        ))
-
-        # Message handler for both private and group messages
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND & (filters.ChatType.GROUPS | filters.ChatType.PRIVATE),
-            handle_message
-        ))
+        # Add handlers, most frequent first; the filters are mutually
+        # exclusive so order only affects how soon a match is found
+        application.add_handlers([
+            # Message handler for both private and group messages
+            MessageHandler(MESSAGE_FILTER, handle_message),
+            CommandHandler("start", start),
+            CommandHandler("help", help_command),
+            CommandHandler("status", status_command),
+            CommandHandler("reset", reset_command),
+            # Add handler for new chat members (bot being added to groups)
+            MessageHandler(NEW_CHAT_MEMBERS_FILTER, handle_new_chat_members),
+        ])
 
         # Add error handler
         application.add_error_handler(error_handler)
 
         # Start the bot
-        logger.info("Bot started...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
-
-    except Exception as e:
-        logger.critical(f"Bot stopped due to error: {str(e)}")
-        raise
-
-def main1():
-    """Main function"""
-    try:
-        # Create application with group message permissions
-        application = (
-            Application.builder()
-            .token(CONFIG['telegram']['token'])
-            .arbitrary_callback_data(True)  # Enable arbitrary callback data
-            .post_init(lambda app: app.bot.set_my_commands([  # Set bot commands
-                BotCommand("start", "Start the bot"),
-                BotCommand("help", "Show help message"),
-                BotCommand("status", "Check bot status"),
-                BotCommand("reset", "Reset conversation"),
-            ]))
-            .build()
-        )
-
-        # Add handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("status", status_command))
-        application.add_handler(CommandHandler("reset", reset_command))
-        
-        # Message handler for both private and group messages
-        application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND & (filters.ChatType.GROUPS | filters.ChatType.PRIVATE),
-            handle_message
-        ))
-        
-        # Add error handler
-        application.add_error_handler(error_handler)
-
-        # Start the bot
-        logger.info("Bot started...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+        webhook_url = CONFIG.telegram.webhook_url
+        if webhook_url:
+            # Telegram pushes updates to us; TLS is expected to be terminated
+            # by a reverse proxy in front of the listen address
+            logger.info(f"Bot started with webhook {webhook_url}...")
+            application.run_webhook(
+                listen=CONFIG.telegram.webhook_listen,
+                port=CONFIG.telegram.webhook_port,
+                url_path=CONFIG.telegram.webhook_path,
+                secret_token=CONFIG.telegram.webhook_secret,
+                webhook_url=webhook_url,
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=True
+            )
+        else:
+            logger.info("Bot started...")
+            application.run_polling(allowed_updates=ALLOWED_UPDATES, drop_pending_updates=True)
 
     except Exception as e:
         logger.critical(f"Bot stopped due to error: {str(e)}")
@@ -1,4 +1,4 @@
 #!/bin/sh
 
 #test the bot
-venv/bin/python -m pytest test_bot.py -v
+venv/bin/python -m pytest test_bot.py -n auto --dist loadscope -v
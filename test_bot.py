@@ -1,32 +1,45 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import dataclasses
+import functools
+import importlib
+import importlib.util
+import time
 import unittest
-from unittest.mock import Mock, patch, AsyncMock
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+from unittest.mock import AsyncMock, call, patch
 from datetime import datetime, timedelta
 import json
 import logging
-from telegram import Update, Chat, Message, User, Bot
-from telegram.ext import ContextTypes
-
-# Import the classes and functions to test
-from bot import (
-    UserRateLimit,
-    AIProvider,
-    load_config,
-    handle_message,
-    handle_new_chat_members,
-    start,
-    help_command,
-    status_command,
-    reset_command
-)
+import re
+from collections import deque
+import httpx
+import respx
+from freezegun import freeze_time
+
+# Keep test runs from formatting and writing log records
+logging.disable(logging.CRITICAL)
+
+if TYPE_CHECKING:
+    import bot
+else:
+    # Imported by setUpModule so collecting the tests doesn't load the bot stack
+    bot = None
+
+def setUpModule():
+    global bot
+    bot = importlib.import_module('bot')
 
 class TestConfig:
     """Mock configuration for testing"""
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def get_test_config():
-        return {
+        # Config is frozen, so every test can share one instance
+        return bot.Config.from_dict({
             'telegram': {
                 'token': 'test_token',
                 'allowed_users': ['test_user'],
@@ -50,15 +63,43 @@ class TestConfig:
                 'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                 'file': 'test_bot.log'
             }
-        }
+        })
+
+class TestLoadConfig(unittest.TestCase):
+    """Test parsing the configuration"""
+
+    def test_defaults_and_allowlists(self):
+        """Test optional settings get defaults and allowlists become sets"""
+        config = TestConfig.get_test_config()
+        self.assertEqual(config.telegram.allowed_users, frozenset({'test_user'}))
+        self.assertEqual(config.telegram.allowed_groups, frozenset({-1001234567890}))
+        self.assertEqual(config.rate_limit.backend, 'memory')
+        self.assertFalse(config.claude.stream)
+
+    def test_allowed_groups_omitted(self):
+        """Test leaving out allowed_groups is told apart from an empty list"""
+        raw = dataclasses.asdict(TestConfig.get_test_config())
+        raw['telegram']['allowed_groups'] = []
+        self.assertEqual(bot.Config.from_dict(raw).telegram.allowed_groups, frozenset())
+        del raw['telegram']['allowed_groups']
+        self.assertIsNone(bot.Config.from_dict(raw).telegram.allowed_groups)
+
+    def test_missing_section(self):
+        """Test a missing config section is reported"""
+        with self.assertRaises(ValueError):
+            bot.Config.from_dict({'telegram': {'token': 'test_token'}})
 
 class TestUserRateLimit(unittest.TestCase):
     """Test the UserRateLimit class"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = TestConfig.get_test_config()
+        cls.rate_limiter = bot.UserRateLimit(cls.config)
+        cls.test_user_id = 12345
     
     def setUp(self):
-        self.config = TestConfig.get_test_config()
-        self.rate_limiter = UserRateLimit(self.config)
-        self.test_user_id = 12345
+        self.rate_limiter.reset()
 
     def test_can_send_message_initial(self):
         """Test initial message sending permission"""
@@ -71,114 +112,451 @@ class TestUserRateLimit(unittest.TestCase):
 
     def test_message_limit(self):
         """Test hourly message limit"""
-        for _ in range(self.config['rate_limit']['max_messages_per_hour']):
-            self.rate_limiter.update_user(self.test_user_id)
-            # Simulate waiting for cooldown
-            self.rate_limiter.last_message_time[self.test_user_id] -= timedelta(
-                seconds=self.config['rate_limit']['cooldown_seconds'] + 1
-            )
-        
+        # Saturate the current minute's bucket, past the cooldown
+        now = time.monotonic()
+        self.rate_limiter.buckets[self.test_user_id] = deque(
+            [[int(now // bot.UserRateLimit.BUCKET_SECONDS), self.config.rate_limit.max_messages_per_hour]],
+            maxlen=bot.UserRateLimit.WINDOW_BUCKETS
+        )
+        self.rate_limiter.last_message_time[self.test_user_id] = (
+            now - self.config.rate_limit.cooldown_seconds - 1
+        )
+
         self.assertFalse(self.rate_limiter.can_send_message(self.test_user_id))
 
-class TestAIProvider(unittest.TestCase):
+    def test_message_limit_with_updates(self):
+        """Test hourly message limit reached through update_user"""
+        cooldown = timedelta(seconds=self.config.rate_limit.cooldown_seconds + 1)
+        with freeze_time(datetime(2024, 1, 1)) as frozen:
+            for _ in range(self.config.rate_limit.max_messages_per_hour):
+                self.rate_limiter.update_user(self.test_user_id)
+                frozen.tick(cooldown)
+
+            self.assertFalse(self.rate_limiter.can_send_message(self.test_user_id))
+
+    def test_window_slides(self):
+        """Test messages older than an hour no longer count"""
+        cooldown = timedelta(seconds=self.config.rate_limit.cooldown_seconds + 1)
+        with freeze_time(datetime(2024, 1, 1)) as frozen:
+            for _ in range(self.config.rate_limit.max_messages_per_hour):
+                self.rate_limiter.update_user(self.test_user_id)
+                frozen.tick(cooldown)
+            self.assertFalse(self.rate_limiter.can_send_message(self.test_user_id))
+
+            frozen.tick(timedelta(hours=1))
+            self.assertTrue(self.rate_limiter.can_send_message(self.test_user_id))
+
+    def test_try_acquire(self):
+        """Test try_acquire records the message it allows"""
+        self.assertTrue(self.rate_limiter.try_acquire(self.test_user_id))
+        self.assertFalse(self.rate_limiter.try_acquire(self.test_user_id))
+
+    def test_create_default_backend(self):
+        """Test the in-process limiter is used unless redis is configured"""
+        self.assertIsInstance(bot.create_rate_limiter(self.config), bot.UserRateLimit)
+
+@unittest.skipUnless(
+    importlib.util.find_spec('fakeredis') and importlib.util.find_spec('lupa'),
+    "requires fakeredis[lua]"
+)
+class TestRedisRateLimit(unittest.IsolatedAsyncioTestCase):
+    """Test the Redis rate limit script against an in-memory Redis"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = TestConfig.get_test_config()
+        cls.test_user_id = 12345
+
+    def make_limiter(self, max_messages, cooldown):
+        import fakeredis
+        config = dataclasses.replace(self.config, rate_limit=dataclasses.replace(
+            self.config.rate_limit, backend='redis',
+            max_messages_per_hour=max_messages, cooldown_seconds=cooldown
+        ))
+        redis = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+        with patch.object(bot.aioredis, 'from_url', return_value=redis):
+            limiter = bot.create_rate_limiter(config)
+        self.addAsyncCleanup(limiter.close)
+        return limiter
+
+    async def test_hourly_limit(self):
+        """Test messages past the hourly limit are refused"""
+        limiter = self.make_limiter(max_messages=3, cooldown=0)
+        results = [await limiter.acquire(self.test_user_id) for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+
+    async def test_cooldown_period(self):
+        """Test a second message within the cooldown is refused"""
+        limiter = self.make_limiter(max_messages=50, cooldown=5)
+        self.assertTrue(await limiter.acquire(self.test_user_id))
+        self.assertFalse(await limiter.acquire(self.test_user_id))
+
+class TestAIProvider(unittest.IsolatedAsyncioTestCase):
     """Test the AIProvider class"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = TestConfig.get_test_config()
+        cls.ai_provider = bot.AIProvider(cls.config)
     
     def setUp(self):
-        self.config = TestConfig.get_test_config()
-        self.ai_provider = AIProvider(self.config)
+        # Answers cached by a previous test would skip the stubbed request
+        self.ai_provider._cache.clear()
+
+    async def asyncTearDown(self):
+        # The HTTP client belongs to this test's event loop
+        await self.ai_provider.close()
 
-    @patch('requests.post')
-    async def test_get_response(self, mock_post):
+    @respx.mock
+    async def test_get_response(self):
         """Test getting response from AI provider"""
         # Mock successful API response
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            'content': [{'text': 'Test response'}]
-        }
-        mock_post.return_value = mock_response
+        respx.post(self.config.claude.api_url).mock(
+            return_value=httpx.Response(200, json={'content': [{'text': 'Test response'}]})
+        )
 
         response = await self.ai_provider.get_response("Test message")
         self.assertEqual(response, "Test response")
 
-    @patch('requests.post')
-    async def test_get_response_with_error(self, mock_post):
+    @respx.mock
+    async def test_concurrent_requests_coalesced(self):
+        """Test concurrent calls for the same question share one API request"""
+        route = respx.post(self.config.claude.api_url).mock(
+            return_value=httpx.Response(200, json={'content': [{'text': 'Test response'}]})
+        )
+
+        responses = await asyncio.gather(
+            self.ai_provider.get_response("Test message"),
+            self.ai_provider.get_response("  test MESSAGE ")
+        )
+
+        self.assertEqual(responses, ["Test response", "Test response"])
+        self.assertEqual(route.call_count, 1)
+        self.assertEqual(self.ai_provider._inflight, {})
+        self.assertEqual(self.ai_provider._pending, 0)
+
+    @respx.mock
+    async def test_busy_when_queue_full(self):
+        """Test new questions are rejected once every slot and queue place is taken"""
+        respx.post(self.config.claude.api_url).mock(
+            return_value=httpx.Response(200, json={'content': [{'text': 'Test response'}]})
+        )
+        config = dataclasses.replace(
+            self.config, claude=dataclasses.replace(self.config.claude, max_concurrent=1, max_queued=0)
+        )
+        provider = bot.AIProvider(config)
+        self.addAsyncCleanup(provider.close)
+
+        first = asyncio.ensure_future(provider.get_response("First message"))
+        await asyncio.sleep(0)
+        with self.assertRaises(bot.AIProviderBusyError):
+            await provider.get_response("Second message")
+        self.assertEqual(await first, "Test response")
+
+    @respx.mock
+    async def test_stream_response(self):
+        """Test streamed text deltas are yielded in order"""
+        events = [
+            {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Test '}},
+            {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'response'}},
+            {'type': 'message_stop'}
+        ]
+        respx.post(self.config.claude.api_url).mock(
+            return_value=httpx.Response(200, text=''.join(f"data: {json.dumps(e)}\n\n" for e in events))
+        )
+
+        chunks = [chunk async for chunk in self.ai_provider.stream_response("Test message")]
+        self.assertEqual(chunks, ['Test ', 'response'])
+
+    @respx.mock
+    async def test_stream_response_incomplete(self):
+        """Test a stream cut off before message_stop, or without text, fails and isn't cached"""
+        delta = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Partial'}}
+        for events in ([delta], [{'type': 'message_stop'}]):
+            with self.subTest(events=[e['type'] for e in events]):
+                respx.post(self.config.claude.api_url).mock(
+                    return_value=httpx.Response(200, text=''.join(f"data: {json.dumps(e)}\n\n" for e in events))
+                )
+
+                with self.assertRaises(Exception):
+                    async for _ in self.ai_provider.stream_response("Test message"):
+                        pass
+                self.assertEqual(len(self.ai_provider._cache), 0)
+                self.assertEqual(self.ai_provider._pending, 0)
+
+    def test_cache_key_normalizes_question(self):
+        """Test cache key ignores case and surrounding whitespace"""
+        self.assertEqual(
+            bot.AIProvider._cache_key("  Hello ", "prompt"),
+            bot.AIProvider._cache_key("hello", "prompt")
+        )
+        self.assertNotEqual(
+            bot.AIProvider._cache_key("hello", "prompt"),
+            bot.AIProvider._cache_key("hello", "other prompt")
+        )
+
+    def test_retry_delay(self):
+        """Test only rate limits, server errors and connection errors are retried"""
+        request = httpx.Request('POST', self.config.claude.api_url)
+
+        def status_error(status, headers=None):
+            response = httpx.Response(status, headers=headers, request=request)
+            return httpx.HTTPStatusError("error", request=request, response=response)
+
+        self.assertIsNone(bot.AIProvider._retry_delay(status_error(400), 1))
+        self.assertEqual(bot.AIProvider._retry_delay(status_error(429, {'retry-after': '7'}), 1), 7)
+        self.assertIsNone(bot.AIProvider._retry_delay(status_error(529, {'retry-after': '120'}), 1))
+        self.assertEqual(bot.AIProvider._retry_delay(status_error(529), 1), 4)
+        self.assertEqual(bot.AIProvider._retry_delay(httpx.ConnectError("down"), 2), 8)
+        self.assertIsNone(bot.AIProvider._retry_delay(ValueError("bad"), 1))
+
+    @respx.mock
+    async def test_get_response_with_error(self):
         """Test error handling in AI provider"""
-        mock_post.side_effect = requests.exceptions.RequestException("API Error")
+        respx.post(self.config.claude.api_url).mock(side_effect=httpx.RequestError("API Error"))
         
-        with self.assertRaises(requests.exceptions.RequestException):
+        with self.assertRaises(httpx.RequestError):
             await self.ai_provider.get_response("Test message")
 
-class TestMessageHandlers(unittest.TestCase):
+class TestSplitResponse(unittest.TestCase):
+    """Test splitting long responses into messages"""
+
+    def test_short_response(self):
+        """Test a short response is sent as one message"""
+        self.assertEqual(bot.split_response("Hello", 10, 3), ["Hello"])
+
+    def test_long_response(self):
+        """Test a long response is split into ordered chunks"""
+        self.assertEqual(bot.split_response("a" * 25, 10, 3), ["a" * 10, "a" * 10, "a" * 5])
+
+    def test_too_many_chunks(self):
+        """Test chunks past the limit are dropped and the last one is marked"""
+        chunks = bot.split_response("a" * 100, 30, 2)
+        self.assertEqual(len(chunks), 2)
+        self.assertLessEqual(len(chunks[-1]), 30)
+        self.assertTrue(chunks[-1].endswith("...(response truncated)"))
+
+class TestMessageHandlers(unittest.IsolatedAsyncioTestCase):
     """Test message handlers"""
 
+    @classmethod
+    def setUpClass(cls):
+        cls.config = TestConfig.get_test_config()
+
     async def asyncSetUp(self):
-        self.config = TestConfig.get_test_config()
-        
-        # Mock update object
-        self.update = Mock(spec=Update)
-        self.update.effective_user = Mock(spec=User)
-        self.update.effective_user.id = 12345
-        self.update.effective_user.username = 'test_user'
-        self.update.message = Mock(spec=Message)
-        self.update.effective_chat = Mock(spec=Chat)
+        # Handlers read the module-level config, provider and rate limiter
+        self._orig_config, self._orig_ai, self._orig_limiter = bot.CONFIG, bot.ai_provider, bot.rate_limiter
+        bot.CONFIG = self.config
+        bot.ai_provider = SimpleNamespace(get_response=AsyncMock(return_value='Test response'))
+        bot.rate_limiter = bot.UserRateLimit(self.config)
         
-        # Mock context
-        self.context = Mock(spec=ContextTypes.DEFAULT_TYPE)
-        self.context.bot = Mock(spec=Bot)
+        # Stand-ins carrying only the attributes the handlers read
+        self.update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=12345, username='test_user'),
+            effective_chat=SimpleNamespace(type='private'),
+            message=SimpleNamespace(text=None, message_id=1, reply_text=AsyncMock())
+        )
         
-        # Mock bot response
-        self.context.bot.get_me = AsyncMock(return_value=Mock(username='test_bot'))
+        # Bot identity cached by post_init
+        self.context = SimpleNamespace(bot_data={
+            'bot_id': 67890,
+            'bot_username': 'test_bot',
+            'bot_mention': '@test_bot',
+            'mention_re': re.compile(re.escape('@test_bot'))
+        })
+
+    async def asyncTearDown(self):
+        bot.CONFIG, bot.ai_provider, bot.rate_limiter = self._orig_config, self._orig_ai, self._orig_limiter
 
-    @patch('bot.ai_provider')
-    async def test_handle_private_message(self, mock_ai):
+    async def test_handle_private_message(self):
         """Test handling private chat message"""
-        self.update.effective_chat.type = 'private'
         self.update.message.text = 'Test message'
         
-        mock_ai.get_response = AsyncMock(return_value='Test response')
-        
-        await handle_message(self.update, self.context)
+        await bot.handle_message(self.update, self.context)
         
         # Verify AI provider was called
-        mock_ai.get_response.assert_called_once()
+        bot.ai_provider.get_response.assert_called_once()
+
+    async def test_long_response_sent_in_order(self):
+        """Test a long response goes out as ordered replies to the question"""
+        self.update.message.text = 'Test message'
+        bot.ai_provider.get_response.return_value = 'a' * 4000 + 'b' * 4000 + 'c' * 10
+
+        await bot.handle_message(self.update, self.context)
+
+        self.assertEqual(self.update.message.reply_text.call_args_list, [
+            call('a' * 4000, reply_to_message_id=1),
+            call('b' * 4000, reply_to_message_id=1),
+            call('c' * 10, reply_to_message_id=1)
+        ])
+
+    async def test_group_message_without_mention_ignored(self):
+        """Test group messages that don't mention the bot are ignored"""
+        self.update.effective_chat.type = 'group'
+        self.update.message.text = 'Test message'
+
+        await bot.handle_message(self.update, self.context)
+
+        bot.ai_provider.get_response.assert_not_called()
+        self.update.message.reply_text.assert_not_called()
+
+    async def test_group_message_mention_stripped(self):
+        """Test the mention is removed from a group question"""
+        self.update.effective_chat.type = 'group'
+        self.update.message.text = '@test_bot Test message'
+
+        await bot.handle_message(self.update, self.context)
+
+        bot.ai_provider.get_response.assert_called_once_with('Test message', bot.DEFAULT_SYSTEM_PROMPT)
+
+    def added_to_group(self, chat_id):
+        """Make the update a notice that the bot joined the given group"""
+        self.update.effective_chat = SimpleNamespace(id=chat_id, title='Test group', leave=AsyncMock())
+        self.update.message.new_chat_members = [SimpleNamespace(id=self.context.bot_data['bot_id'])]
+
+    async def test_added_to_allowed_group(self):
+        """Test the bot stays in a listed group"""
+        self.added_to_group(-1001234567890)
+
+        await bot.handle_new_chat_members(self.update, self.context)
+
+        self.update.effective_chat.leave.assert_not_called()
+        self.update.message.reply_text.assert_not_called()
+
+    async def test_added_to_unauthorized_group(self):
+        """Test the bot announces it is leaving and leaves an unlisted group"""
+        self.added_to_group(-1009876543210)
+
+        await bot.handle_new_chat_members(self.update, self.context)
+
+        self.update.message.reply_text.assert_called_once_with(bot.UNAUTHORIZED_GROUP_TEXT)
+        self.update.effective_chat.leave.assert_awaited_once()
+
+    async def test_empty_allowed_groups_leaves(self):
+        """Test an empty allowed_groups list keeps the bot out of every group"""
+        bot.CONFIG = dataclasses.replace(
+            self.config, telegram=dataclasses.replace(self.config.telegram, allowed_groups=frozenset())
+        )
+        self.added_to_group(-1001234567890)
+
+        await bot.handle_new_chat_members(self.update, self.context)
+
+        self.update.effective_chat.leave.assert_awaited_once()
+
+    async def test_handle_busy(self):
+        """Test the busy reply is sent when the provider turns the question away"""
+        self.update.message.text = 'Test message'
+        bot.ai_provider.get_response.side_effect = bot.AIProviderBusyError("busy")
+
+        await bot.handle_message(self.update, self.context)
+
+        self.update.message.reply_text.assert_called_once_with(bot.BUSY_TEXT, reply_to_message_id=1)
 
     async def test_handle_unauthorized_user(self):
         """Test handling message from unauthorized user"""
         self.update.effective_user.username = 'unauthorized_user'
+        self.update.message.text = 'Test message'
         
-        await handle_message(self.update, self.context)
+        await bot.handle_message(self.update, self.context)
         
         self.update.message.reply_text.assert_called_with(
             "⚠️ Sorry, you don't have permission to use this bot"
         )
 
-class TestCommandHandlers(unittest.TestCase):
-    """Test command handlers"""
+class TestStreamReply(unittest.IsolatedAsyncioTestCase):
+    """Test streaming a response into an edited reply"""
+
+    @classmethod
+    def setUpClass(cls):
+        config = TestConfig.get_test_config()
+        cls.config = dataclasses.replace(
+            config, telegram=dataclasses.replace(config.telegram, max_response_length=12)
+        )
 
     async def asyncSetUp(self):
-        self.update = Mock(spec=Update)
-        self.update.message = Mock(spec=Message)
-        self.context = Mock(spec=ContextTypes.DEFAULT_TYPE)
-
-    async def test_start_command(self):
-        """Test /start command"""
-        await start(self.update, self.context)
-        self.update.message.reply_text.assert_called_once()
-
-    async def test_help_command(self):
-        """Test /help command"""
-        await help_command(self.update, self.context)
-        self.update.message.reply_text.assert_called_once()
-
-    async def test_status_command(self):
-        """Test /status command"""
-        await status_command(self.update, self.context)
-        self.update.message.reply_text.assert_called_once()
-
-    async def test_reset_command(self):
-        """Test /reset command"""
-        await reset_command(self.update, self.context)
-        self.update.message.reply_text.assert_called_once()
+        self._orig_config, self._orig_ai = bot.CONFIG, bot.ai_provider
+        bot.CONFIG = self.config
+        bot.ai_provider = SimpleNamespace()
+
+        self.reply = SimpleNamespace(edit_text=AsyncMock(), delete=AsyncMock())
+        self.update = SimpleNamespace(
+            message=SimpleNamespace(message_id=1, reply_text=AsyncMock(return_value=self.reply))
+        )
+
+        clock = freeze_time(datetime(2024, 1, 1))
+        self.frozen = clock.start()
+        self.addCleanup(clock.stop)
+
+    async def asyncTearDown(self):
+        bot.CONFIG, bot.ai_provider = self._orig_config, self._orig_ai
+
+    def stream(self, *steps):
+        """Stub stream_response with text deltas; numbers advance the clock, exceptions are raised"""
+        async def stream_response(question, system_prompt):
+            for step in steps:
+                if isinstance(step, str):
+                    yield step
+                elif isinstance(step, Exception):
+                    raise step
+                else:
+                    self.frozen.tick(timedelta(seconds=step))
+        bot.ai_provider.stream_response = stream_response
+
+    async def test_stream_reply(self):
+        """Test edits are debounced, the final edit fills the first message and the rest follows"""
+        self.stream("Hi", 1, " there", " friend, bye")
+
+        response = await bot.stream_reply(self.update, "question", "prompt")
+
+        self.assertEqual(response, "Hi there friend, bye")
+        self.assertEqual(self.reply.edit_text.call_args_list, [call("Hi there"), call("Hi there fri")])
+        self.assertEqual(self.update.message.reply_text.call_args_list, [
+            call("…", reply_to_message_id=1),
+            call("end, bye", reply_to_message_id=1)
+        ])
+
+    async def test_error_removes_placeholder(self):
+        """Test the placeholder is deleted when the request fails before any text is shown"""
+        self.stream(bot.AIProviderBusyError("busy"))
+
+        with self.assertRaises(bot.AIProviderBusyError):
+            await bot.stream_reply(self.update, "question", "prompt")
+
+        self.reply.delete.assert_awaited_once()
+        self.reply.edit_text.assert_not_called()
+
+    async def test_whitespace_delta_skips_edit(self):
+        """Test a delta that only adds whitespace doesn't trigger an edit"""
+        self.stream(2, "Hello", 2, "\n\n")
+
+        await bot.stream_reply(self.update, "question", "prompt")
+
+        self.assertEqual(self.reply.edit_text.call_args_list, [call("Hello")])
+
+    async def test_failed_edit_continues(self):
+        """Test a rejected intermediate edit doesn't end the stream"""
+        self.reply.edit_text.side_effect = [bot.BadRequest("Message is not modified"), None]
+        self.stream(2, "Hello", " world")
+
+        response = await bot.stream_reply(self.update, "question", "prompt")
+
+        self.assertEqual(response, "Hello world")
+        self.assertEqual(self.reply.edit_text.call_args_list, [call("Hello"), call("Hello world")])
+
+class TestCommandHandlers(unittest.IsolatedAsyncioTestCase):
+    """Test command handlers"""
+
+    async def test_simple_commands(self):
+        """Test /start, /help, /status and /reset each send one reply"""
+        context = SimpleNamespace()
+        for handler in (bot.start, bot.help_command, bot.status_command, bot.reset_command):
+            with self.subTest(handler=handler.__name__):
+                update = SimpleNamespace(message=SimpleNamespace(reply_text=AsyncMock()))
+                await handler(update, context)
+                update.message.reply_text.assert_called_once()
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
 
 if __name__ == '__main__':
     unittest.main()